@@ -1,5 +1,11 @@
+import sys
+import time
+from dataclasses import dataclass, field
+from typing import Any
 import serial
-import matplotlib.pyplot as plt
+
+if sys.platform == 'win32':
+    import ctypes
 
 '''
 This program is inteded to control a Synrad laser using the UC2000 controller
@@ -30,38 +36,81 @@ num_shots = 2    # number of shots
 
 ###########################################
 
+def _drain(port, timeout=0.1):
+    """
+    Waits until the port's output buffer is empty.
+
+    Unlike port.flush(), which is an unbounded tcdrain() on POSIX and an
+    unbounded poll on Windows, this gives up after timeout seconds and
+    raises serial.SerialTimeoutException.
+    """
+    deadline = time.perf_counter() + timeout
+    while port.out_waiting:
+        if time.perf_counter() > deadline:
+            raise serial.SerialTimeoutException(
+                "Output buffer did not drain within %.3f s" % timeout)
+
 def main():
     print('Initializing UC2000')
     
-    with serial.Serial('COM%i'%com_port, baudrate=9600, timeout=0.05) as uc2000:
+    if sys.platform == 'win32':
+        # 1 ms timer resolution, so that time.sleep(delay) is not rounded
+        # up to the default ~15.6 ms scheduler tick
+        ctypes.windll.winmm.timeBeginPeriod(1)
+    
+    try:
+        # write_timeout only bounds how long write() waits to hand the bytes
+        # to the OS driver; a blocked hand-off raises SerialTimeoutException
+        # after 100 ms instead of stalling. Draining to the wire is bounded
+        # separately by _drain(). A 4-byte message takes ~4 ms at 9600 baud.
+        with serial.Serial('COM%i'%com_port, baudrate=9600, timeout=0.05,
+                           write_timeout=0.1, rtscts=False,
+                           dsrdtr=False) as uc2000:
     
-        mess = Message('status_request', False, False).message_bytes
-        uc2000.write(mess)
-        m = uc2000.readline()
-        print('The Synrad UC2000 reports this status:', m)
+            uc2000.write(STATUS_REQUEST)
+            m = uc2000.readline()
+            print('The Synrad UC2000 reports this status:', m)
 
-        print ('Setting the power to %.1f percent.'%power)
+            print ('Setting the power to %.1f percent.'%power)
         
-        # set the percentage
-        mess = Message('percent', power, False).message_bytes
-        uc2000.write(mess)
+            # set the percentage
+            uc2000.write(percent_msg(power))
                 
-        for n in range(num_shots):
-            if n>0:
-                plt.pause(delay)
+            try:
+                for n in range(num_shots):
+                    if n>0:
+                        time.sleep(delay)
                 
-            # Start the laser!
-            mess = Message('lase', True, False).message_bytes
-            uc2000.write(mess)
+                    # Start the laser! Wait for the bytes to leave the output
+                    # buffer, so that the shot time is measured from the laser
+                    # turning on rather than from the command being queued.
+                    uc2000.write(LASE_ON)
+                    _drain(uc2000)
             
-            # Wait for the target to be destroyed
-            plt.pause(shot_time)
+                    # Wait for the target to be destroyed. Spin rather than
+                    # sleep, since the shot time is the laser exposure time.
+                    deadline = time.perf_counter() + shot_time
+                    while time.perf_counter() < deadline:
+                        pass
             
-            # Stop the laser
-            mess = Message('lase', False, True).message_bytes
-            uc2000.write(mess)
+                    # Stop the laser. This has always been sent with a
+                    # checksum, unlike LASE_ON; kept as-is since it is what
+                    # has been run against the UC2000 with the checksum
+                    # disabled.
+                    uc2000.write(LASE_OFF_CHECKSUM)
+                    _drain(uc2000)
             
-            # Step 4: profit
+                    # Step 4: profit
+            finally:
+                # Best effort to make sure the laser is not left on if a
+                # write or drain above timed out or otherwise failed
+                try:
+                    uc2000.write(LASE_OFF_CHECKSUM)
+                except serial.SerialException:
+                    pass
+    finally:
+        if sys.platform == 'win32':
+            ctypes.windll.winmm.timeEndPeriod(1)
         
 
 # the rest of this code is from: https://github.com/TobyBi/Synrad-UC2000/blob/main/uc2000.py
@@ -102,6 +151,7 @@ _UC2000_COMMAND_BYTES = {
     },
 }
 
+@dataclass(frozen=True, slots=True)
 class Message():
     """
     REMOTE Message sent to UC-2000 on REMOTE mode through RS-232 serial
@@ -153,14 +203,20 @@ class Message():
     Examples
     --------
     >>> message = Message("percent", 10, False)
-    >>> message.message_bytes()
-    [126, 127, 20]
+    >>> message.message_bytes
+    b'[\\x7f\\x14'
 
     Create message for setting PWM percent to 10%.
 
+    >>> Message("percent", 2.5, True).message_bytes
+    b'[\\x7f\\x05{'
+
+    Create message for setting PWM percent to 2.5% with a checksum. The
+    checksum 0x7b is ~(0x7f + 0x05) & 0xff.
+
     >>> message = Message("lase", True, False)
-    >>> message.message_bytes()
-    [126, 127, 117]
+    >>> message.message_bytes
+    b'[u'
 
     Create message for turning on command signal.
     """
@@ -169,118 +225,137 @@ class Message():
     _status_request_byte = 0x7e
     _set_percent_byte = 0x7f
 
-    def __init__(self, command: str, data, checksum: bool):
-        """Inits a Message object."""
-        self.command = command
-        """Command to perform"""
-        self.checksum = checksum
-        """Checksum protocol mode."""
-        self.data = data
-        """Data for PWM (or SET for closed loop) command."""
-
-    @property
-    def message_bytes(self):
+    command: str
+    """Command to perform"""
+    data: Any
+    """Data for PWM (or SET for closed loop) command."""
+    checksum: bool
+    """Checksum protocol mode."""
+    message_bytes: bytes = field(init=False, repr=False, compare=False)
+    """REMOTE message byte sequence, ready to write to the port."""
+
+    def __post_init__(self):
+        """Validates the data and looks up the message bytes."""
+        if self.command == "percent" and not isinstance(
+                self.data, (int, float)):
+            raise TypeError(
+                "Type of data is invalid. Needs to be float or int.")
+
+        # frozen, so bypass the dataclass __setattr__
+        object.__setattr__(self, "message_bytes", self._build())
+
+    def _build(self):
         """
         Creates and returns REMOTE message byte sequence.
 
         Returns
         -------
-        message : list of int
+        message : bytes
             The message sequence containing the start byte, command byte,
             [data byte (optional)], and checksum (optional)
         """
-        if self.command in _UC2000_COMMAND_BYTES.keys():
-            command_byte = _UC2000_COMMAND_BYTES[self.command][self.data]
-
-            message = [self._start_byte, command_byte]
-
-            if self.checksum:
-                # without data, the checksum is the one's compliment of the
-                # command byte
-                checksum_byte = ~command_byte & 0xff
-                message.append(checksum_byte)
-
-        elif self.command == "percent":
-            try:
-                message = [
-                    self._start_byte, self._set_percent_byte, int(2*self.data)]
-            except ValueError:
-                raise ValueError(
-            "Type of data is invalid. Needs to be float or int.")
-
-            if self.checksum:
-                # with data, the checksum is the addition without carry of the
-                # command and data byte and then one's complimented
-                checksum_byte = (
-                    ~self.add_no_carry(
-                        self._set_percent_byte, self.data) & 0xff
-                    )
-                message.append(checksum_byte)
-
-        elif self.command == "status_request":
-            message = [self._status_request_byte]
-
-        else:
+        try:
+            builder = _BUILDERS[self.command]
+        except KeyError:
             raise ValueError("Command is not recognised by UC-2000")
 
-        return message
+        return builder(self.command, self.data, self.checksum)
 
     @staticmethod
-    def add_no_carry(*args):
+    def add_no_carry(a, b):
         """
-        Addition without carry; addition is not carried to the next decimal up.
+        Addition without carry; the carry out of the byte is dropped.
 
         Parameters
         ----------
-        *args : iterable (not string)
-            Iterate of ints to add without carry.
+        a, b : int
+            Bytes (0-255) to add without carry.
 
         Returns
         -------
-        final_sum : int
-            the result...
+        int
+            (a + b) & 0xff
 
         Examples
         --------
-        >>> add_no_carry(1, 1)
-        2
+        >>> Message.add_no_carry(0x7f, 0x14)
+        147
+
+        >>> Message.add_no_carry(0x7f, 0x05)
+        132
 
-        >>> add_no_carry(1, 18)
-        19
+        The decimal digits 7 + 5 carry here, and the sum is still 132, not
+        122 as a per-digit decimal reading would give.
 
-        >>> add_no_carry(1, 19)
-        10
+        >>> Message.add_no_carry(0x7f, 0xc8)
+        71
 
-        The '10' is not carried over to the next decimal.
+        The carry out of 0x7f + 0xc8 = 0x147 is dropped, leaving 0x47.
         """
-        num_digits = []
-
-        for arg in args:
-            num_digits.append(len(str(arg)))
-
-        max_digits = max(num_digits)
-        # list comprehension way
-        # max_digits = max([len(str(arg)) for arg in args])
-        final_sum = 0
-
-        for pwr in range(1, max_digits + 1): # iterate through ea decimal
-            result_no_carry = 0
-            for arg in args:
-                if len(str(arg)) >= pwr:
-                    # modulus sets the current decimal as the most significant
-                    # decimal
-                    # floor div selects the most significant decimal
-                    result_no_carry += arg % 10**pwr // 10**(pwr - 1)
-
-            # list comprehension way
-            # result_no_carry = sum([arg % 10**pwr // 10**(pwr - 1) for arg in args if len(str(arg)) >= pwr])
-
-            # final_sum = str(result_no_carry % 10) + final_sum
-            final_sum += result_no_carry % 10
-        
-        print(final_sum)
-        return int(final_sum)
+        return (a + b) & 0xff
+
+# =============================================================================
+# Builders for each message format
+# =============================================================================
+
+def _setup_bytes(command_byte):
+    """Setup, Mode, and Lase: STX<Command>[<Checksum>], without and with."""
+    message = bytes((Message._start_byte, command_byte))
+    # without data, the checksum is the one's compliment of the command byte
+    return {False: message, True: message + bytes((~command_byte & 0xff,))}
+
+def _percent_bytes(data_byte):
+    """PWM (or SET): STX<Command><Data Byte>[<Checksum>], without and with."""
+    message = bytes(
+        (Message._start_byte, Message._set_percent_byte, data_byte))
+    # with data, the checksum is the addition without carry of the command
+    # and data byte and then one's complimented
+    checksum_byte = ~Message.add_no_carry(
+        Message._set_percent_byte, data_byte) & 0xff
+    return {False: message, True: message + bytes((checksum_byte,))}
+
+# Complete messages for every setup-style command and every percent data
+# byte (0-100 % in 0.5 % steps), indexed [command][data][checksum] and
+# [data byte][checksum] respectively
+_PRECOMP = {
+    command: {data: _setup_bytes(byte) for data, byte in datas.items()}
+    for command, datas in _UC2000_COMMAND_BYTES.items()
+}
+_PERCENT_PRECOMP = {
+    data_byte: _percent_bytes(data_byte) for data_byte in range(201)}
+
+def _build_setup(command, data, checksum):
+    """Setup, Mode, and Lase: STX<Command>[<Checksum>]."""
+    return _PRECOMP[command][data][bool(checksum)]
+
+def _build_percent(command, data, checksum):
+    """PWM (or SET): STX<Command><Data Byte>[<Checksum>]."""
+    # checked explicitly, since int() truncates -0.4 to 0 and rejects nan
+    if not 0 <= data <= 100:
+        raise ValueError("Percent must be between 0 and 100.")
+
+    return _PERCENT_PRECOMP[int(data*2)][bool(checksum)]
+
+def _build_status(command, data, checksum):
+    """Status Request: a single byte, sent without STX."""
+    return bytes((Message._status_request_byte,))
+
+# Dict for converting between command name and the builder for its format
+_BUILDERS = dict.fromkeys(_UC2000_COMMAND_BYTES, _build_setup)
+_BUILDERS["percent"] = _build_percent
+_BUILDERS["status_request"] = _build_status
+
+# =============================================================================
+# Fixed messages, built once at import
+# =============================================================================
+
+STATUS_REQUEST = Message("status_request", False, False).message_bytes
+LASE_ON = Message("lase", True, False).message_bytes
+LASE_OFF_CHECKSUM = Message("lase", False, True).message_bytes
 
+def percent_msg(percent, checksum=False):
+    """Returns the PWM (or SET) message bytes for the given percentage."""
+    return Message("percent", percent, checksum).message_bytes
 
 
 if __name__ == '__main__':